@@ -4,7 +4,9 @@ import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.patches import Patch
 import seaborn as sns
+from profiling import timed
 
+@timed('plot.average_day_comparison')
 def create_average_day_comparison_plot(
     settlement, 
     intervention_type='MEB',
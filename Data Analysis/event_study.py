@@ -0,0 +1,268 @@
+import pandas as pd
+import numpy as np
+from scipy import stats
+from profiling import stage, timed
+
+
+class EventStudy:
+    """
+    Event-study estimator of daily and hourly treatment effects, relative to each
+    settlement's Intervention_Start, built from cumulative per-(logger, day, hour) sums.
+
+    Each logger contributes the deviation of its daily mean temperature difference from
+    its own pre-intervention mean. The effect for an event day is the treated mean of
+    these deviations minus the control mean, with logger-clustered standard errors
+    taken from the spread across loggers. New minute data is folded into the running
+    sums with `update`, so a day of data never triggers a refit over the full history.
+
+    Parameters:
+    -----------
+    logger_flags_df : DataFrame
+        Contents of logger_flags.csv
+    control : str
+        Intervention label used for control loggers (default: 'CONTROL')
+    """
+
+    def __init__(self, logger_flags_df, control='CONTROL'):
+        self.flags = logger_flags_df.set_index('Loggers')
+        self.loggers = self.flags.index.tolist()
+        self.control = control
+        self.intervention_start = pd.to_datetime(self.flags['Intervention_Start']).values.astype('datetime64[D]')
+
+        # Day axis runs from `_origin` and grows by doubling, so a new day rarely reallocates
+        n_loggers = len(self.loggers)
+        self._origin = None
+        self._n_days = 0
+        self._sum_buffer = np.zeros((n_loggers, 0, 24))
+        self._count_buffer = np.zeros((n_loggers, 0, 24))
+
+        # Running pre/post totals per (logger, hour) so each day only adds to them
+        self._pre_sum = np.zeros((n_loggers, 24))
+        self._pre_count = np.zeros((n_loggers, 24))
+        self._post_sum = np.zeros((n_loggers, 24))
+        self._post_count = np.zeros((n_loggers, 24))
+
+    @property
+    def dates(self):
+        if self._origin is None:
+            return np.array([], dtype='datetime64[D]')
+        return self._origin + np.arange(self._n_days)
+
+    @property
+    def _sum(self):
+        return self._sum_buffer[:, :self._n_days]
+
+    @property
+    def _count(self):
+        return self._count_buffer[:, :self._n_days]
+
+    def _reserve(self, lo, hi):
+        """Make day offsets [lo, hi) relative to the current origin addressable."""
+        capacity = self._sum_buffer.shape[1]
+        shift = max(-lo, 0)
+        if shift == 0 and hi <= capacity:
+            self._n_days = max(self._n_days, hi)
+            return
+
+        # Data older than the origin (a backfill) shifts everything right; otherwise just grow
+        needed = max(hi, self._n_days) + shift
+        new_capacity = max(needed, 2 * capacity)
+        n_loggers = len(self.loggers)
+        total = np.zeros((n_loggers, new_capacity, 24))
+        count = np.zeros((n_loggers, new_capacity, 24))
+        total[:, shift:shift + self._n_days] = self._sum
+        count[:, shift:shift + self._n_days] = self._count
+
+        self._sum_buffer, self._count_buffer = total, count
+        self._origin = self._origin - shift
+        self._n_days = needed
+
+    def update(self, temp_diff_df):
+        """
+        Add minute-level temperature differences to the running sums. The cost depends
+        only on the rows passed in and the days they span, not on the history already held.
+
+        Parameters:
+        -----------
+        temp_diff_df : DataFrame
+            Rows of temperature_differences.csv: a 'DateTime' column (or DatetimeIndex)
+            and one column per logger. Rows may belong to days already seen.
+        """
+        if 'DateTime' in temp_diff_df.columns:
+            temp_diff_df = temp_diff_df.set_index('DateTime')
+        if temp_diff_df.empty:
+            return self
+
+        with stage('event_study.update', rows=len(temp_diff_df)):
+            self._accumulate(temp_diff_df)
+        return self
+
+    def _accumulate(self, temp_diff_df):
+        timestamps = pd.DatetimeIndex(temp_diff_df.index)
+        days = timestamps.values.astype('datetime64[D]')
+        hours = timestamps.hour.values
+
+        if self._origin is None:
+            self._origin = days.min()
+        offsets = (days - self._origin).astype(np.int64)
+        self._reserve(offsets.min(), offsets.max() + 1)
+        # The origin moves back when older days are backfilled
+        offsets = (days - self._origin).astype(np.int64)
+        lo, hi = offsets.min(), offsets.max() + 1
+
+        # Only the days covered by the new rows are touched below
+        keys = (offsets - lo) * 24 + hours
+        n_cells = (hi - lo) * 24
+        new_dates = self._origin + np.arange(lo, hi)
+
+        for i, logger in enumerate(self.loggers):
+            if logger not in temp_diff_df.columns:
+                continue
+            values = temp_diff_df[logger].to_numpy(dtype=float)
+            valid = ~np.isnan(values)
+            if not valid.any():
+                continue
+
+            total = np.bincount(keys[valid], weights=values[valid], minlength=n_cells).reshape(-1, 24)
+            count = np.bincount(keys[valid], minlength=n_cells).reshape(-1, 24)
+            self._sum_buffer[i, lo:hi] += total
+            self._count_buffer[i, lo:hi] += count
+
+            post = (new_dates >= self.intervention_start[i])[:, None]
+            self._pre_sum[i] += np.where(post, 0, total).sum(axis=0)
+            self._pre_count[i] += np.where(post, 0, count).sum(axis=0)
+            self._post_sum[i] += np.where(post, total, 0).sum(axis=0)
+            self._post_count[i] += np.where(post, count, 0).sum(axis=0)
+
+    def _groups(self, intervention, settlement=None, shaded=None):
+        flags = self.flags
+        selected = np.ones(len(flags), dtype=bool)
+        if settlement is not None:
+            selected &= (flags['Settlement'] == settlement).values
+        if shaded is not None:
+            selected &= (flags['Shaded'] == shaded).values
+
+        treated = selected & (flags['Intervention'] == intervention).values
+        control = selected & (flags['Intervention'] == self.control).values
+        return treated, control
+
+    @staticmethod
+    def _contrast(deviations, treated, control, alpha):
+        """Treated-minus-control mean of per-logger deviations with logger-clustered SE."""
+        def group_moments(members):
+            mask = ~np.isnan(deviations) & members[:, None]
+            values = np.where(mask, deviations, 0)
+            n = mask.sum(axis=0)
+            mean = values.sum(axis=0) / n
+            var = (np.where(mask, values - mean, 0) ** 2).sum(axis=0) / (n - 1)
+            return n, mean, var
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            n_t, mean_t, var_t = group_moments(treated)
+            n_c, mean_c, var_c = group_moments(control)
+
+            effect = mean_t - mean_c
+            se = np.sqrt(var_t / n_t + var_c / n_c)
+            critical = stats.t.ppf(1 - alpha / 2, np.maximum(n_t + n_c - 2, 1))
+
+        return pd.DataFrame({
+            'Effect': effect,
+            'SE': se,
+            'CI_Lower': effect - critical * se,
+            'CI_Upper': effect + critical * se,
+            'N_Treated': n_t,
+            'N_Control': n_c,
+        })
+
+    def _pre_means(self, hourly=False):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if hourly:
+                return self._pre_sum / self._pre_count
+            return self._pre_sum.sum(axis=1) / self._pre_count.sum(axis=1)
+
+    @timed('event_study.daily_effects')
+    def daily_effects(self, intervention, settlement=None, shaded=None, alpha=0.05):
+        """
+        Treatment effect for every event day (days since Intervention_Start).
+
+        Parameters:
+        -----------
+        intervention : str
+            Intervention compared against control loggers ('RBF' or 'MEB')
+        settlement : str, optional
+            Restrict to one settlement
+        shaded : bool, optional
+            Restrict to shaded (True) or unshaded (False) structures
+        alpha : float
+            Significance level of the confidence band (default: 0.05)
+
+        Returns:
+        --------
+        DataFrame with one row per event day
+        """
+        if self._n_days == 0:
+            return pd.DataFrame(columns=['Intervention', 'Event_Day', 'Effect', 'SE', 'CI_Lower', 'CI_Upper',
+                                         'N_Treated', 'N_Control'])
+
+        treated, control = self._groups(intervention, settlement, shaded)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            daily_means = self._sum.sum(axis=2) / self._count.sum(axis=2)
+        deviations = daily_means - self._pre_means()[:, None]
+
+        event_days = (self.dates[None, :] - self.intervention_start[:, None]).astype(int)
+        lo, hi = event_days.min(), event_days.max()
+        width = hi - lo + 1
+
+        # Re-align every logger on event time so settlements with different start dates pool together
+        aligned = np.full((len(self.loggers), width), np.nan)
+        rows = np.repeat(np.arange(len(self.loggers)), self.dates.size)
+        aligned[rows, (event_days - lo).ravel()] = deviations.ravel()
+
+        result = self._contrast(aligned, treated, control, alpha)
+        result.insert(0, 'Event_Day', np.arange(lo, hi + 1))
+        result.insert(0, 'Intervention', intervention)
+        return result[(result['N_Treated'] > 0) & (result['N_Control'] > 0)].reset_index(drop=True)
+
+    @timed('event_study.hourly_effects')
+    def hourly_effects(self, intervention, settlement=None, shaded=None, alpha=0.05):
+        """
+        Post-intervention treatment effect for each hour of the day, relative to
+        the same hour in each logger's pre-intervention period.
+
+        Parameters are as for `daily_effects`.
+        """
+        treated, control = self._groups(intervention, settlement, shaded)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            post_means = self._post_sum / self._post_count
+        deviations = post_means - self._pre_means(hourly=True)
+
+        result = self._contrast(deviations, treated, control, alpha)
+        result.insert(0, 'Hour', np.arange(24))
+        result.insert(0, 'Intervention', intervention)
+        return result
+
+
+if __name__ == '__main__':
+    with stage('ingest.temperature_differences', path='temperature_differences.csv') as record:
+        temperature_differences_df = pd.read_csv('temperature_differences.csv', parse_dates=['DateTime'])
+        record.rows = len(temperature_differences_df)
+    logger_flags_df = pd.read_csv('logger_flags.csv')
+
+    event_study = EventStudy(logger_flags_df)
+
+    # Feed the data one day at a time, as it would arrive during a live deployment
+    for date, day_df in temperature_differences_df.groupby(temperature_differences_df['DateTime'].dt.date):
+        event_study.update(day_df)
+
+    daily_results = pd.concat([event_study.daily_effects(intervention) for intervention in ['RBF', 'MEB']])
+    hourly_results = pd.concat([event_study.hourly_effects(intervention) for intervention in ['RBF', 'MEB']])
+
+    print("Daily event-study effects:")
+    print(daily_results)
+    print("\nHourly post-intervention effects:")
+    print(hourly_results)
+
+    daily_results.to_csv('event_study_daily_effects.csv', index=False)
+    hourly_results.to_csv('event_study_hourly_effects.csv', index=False)
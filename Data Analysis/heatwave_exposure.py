@@ -0,0 +1,313 @@
+import os
+import glob
+import pandas as pd
+import numpy as np
+from profiling import stage, timed
+
+HEAT_INDEX_BANDS = {
+    'Caution': (27, 32),
+    'Extreme Caution': (32, 41),
+    'Danger': (41, 54),
+    'Extreme Danger': (54, np.inf),
+}
+
+
+def calculate_heat_index(temperature, humidity):
+    """Calculate heat index using temperature (°C) and relative humidity (%). Works on arrays."""
+    T = temperature * 9/5 + 32
+    RH = humidity
+
+    HI = -42.379 + 2.04901523*T + 10.14333127*RH - 0.22475541*T*RH - 6.83783e-3*T**2 - 5.481717e-2*RH**2 + 1.22874e-3*T**2*RH + 8.5282e-4*T*RH**2 - 1.99e-6*T**2*RH**2
+    return (HI - 32) * 5/9
+
+
+def classify_heat_wave(temp, normal_temp):
+    """
+    Vectorized version of `is_heat_wave`: classify every temperature against its normal
+    temperature in one call. NaN temperatures are classified as 'Normal'.
+    """
+    temp = np.asarray(temp, dtype=float)
+    departure = temp - np.asarray(normal_temp, dtype=float)
+    conditions = [
+        temp >= 45,
+        (temp >= 40) & (departure > 6.4),
+        (temp >= 40) & (departure >= 4.5) & (departure <= 6.4),
+    ]
+    choices = ['Severe Heat Wave (Actual)', 'Severe Heat Wave', 'Heat Wave']
+    return np.select(conditions, choices, default='Normal')
+
+
+def run_lengths(mask, breaks=None):
+    """
+    Run-length encode a boolean matrix column by column.
+
+    Parameters:
+    -----------
+    mask : ndarray (time x series)
+        True where the condition holds
+    breaks : ndarray (time x series), optional
+        Labels whose changes also end a run (e.g. pre/post window ids)
+
+    Returns:
+    --------
+    (column, start, length) arrays, one entry per run of True values
+    """
+    mask = np.asarray(mask, dtype=bool)
+    if mask.ndim == 1:
+        mask = mask[:, None]
+    n_time, n_series = mask.shape
+
+    # Pad each column with False so every run has a start and an end edge
+    padded = np.zeros((n_time + 2, n_series), dtype=bool)
+    padded[1:-1] = mask
+    if breaks is not None:
+        breaks = np.asarray(breaks)
+        if breaks.ndim == 1:
+            breaks = breaks[:, None]
+        split = np.zeros((n_time + 1, n_series), dtype=bool)
+        split[1:-1] = breaks[1:] != breaks[:-1]
+        edges = np.diff(padded.astype(np.int8), axis=0)
+        edges[split & padded[1:] & padded[:-1]] = 2
+    else:
+        edges = np.diff(padded.astype(np.int8), axis=0)
+
+    # Work column-major so runs are ordered by series, then time
+    start_time, start_col = np.nonzero(((edges == 1) | (edges == 2)).T)[::-1]
+    end_time, end_col = np.nonzero(((edges == -1) | (edges == 2)).T)[::-1]
+    return start_col, start_time, end_time - start_time
+
+
+@timed('heatwave.heat_wave_days')
+def heat_wave_days(daily_max, normal_max, min_days=3):
+    """
+    Classify every day of every series and label consecutive heat-wave days as events.
+
+    Parameters:
+    -----------
+    daily_max : DataFrame
+        Daily maximum temperature, one column per series (ambient and loggers)
+    normal_max : float, Series or DataFrame
+        Normal maximum temperature to compute departures against. A Series is
+        aligned on the date index and applied to every column.
+    min_days : int
+        Minimum number of consecutive heat-wave days that counts as an event (default: 3)
+
+    Returns:
+    --------
+    Tidy DataFrame with one row per (series, date)
+    """
+    values = daily_max.to_numpy(dtype=float)
+    if isinstance(normal_max, pd.Series):
+        normal = normal_max.reindex(daily_max.index).to_numpy(dtype=float)[:, None]
+    elif isinstance(normal_max, pd.DataFrame):
+        normal = normal_max.reindex(index=daily_max.index, columns=daily_max.columns).to_numpy(dtype=float)
+    else:
+        normal = np.full((1, 1), normal_max, dtype=float)
+    normal = np.broadcast_to(normal, values.shape)
+
+    classification = classify_heat_wave(values, normal)
+    column, start, length = run_lengths(classification != 'Normal')
+
+    event_id = np.zeros(values.shape, dtype=int)
+    event_length = np.zeros(values.shape, dtype=int)
+    keep = length >= min_days
+    for event, (col, first, n) in enumerate(zip(column[keep], start[keep], length[keep]), start=1):
+        event_id[first:first + n, col] = event
+        event_length[first:first + n, col] = n
+
+    n_days, n_series = values.shape
+    return pd.DataFrame({
+        'Series': np.tile(daily_max.columns.to_numpy(), n_days),
+        'Date': np.repeat(daily_max.index.to_numpy(), n_series),
+        'Daily_Max': values.ravel(),
+        'Normal_Max': normal.ravel(),
+        'Classification': classification.ravel(),
+        'Event_ID': event_id.ravel(),
+        'Event_Length_Days': event_length.ravel(),
+    })
+
+
+def load_normal_max(daily_index, path='normal_max_temperature.csv'):
+    """
+    Climatological normal maximum temperature for each day of `daily_index`.
+
+    The IMD departure thresholds (4.5 and 6.4 °C) are defined against a long-term normal,
+    so the normal should come from station climatology. `path` is a CSV with either a
+    'Date' column (one row per calendar date of the study) or a 'Month' and 'Day' pair
+    (day-of-year normals), plus a 'Normal_Max' column. Returns None if the file is absent.
+    """
+    if not os.path.isfile(path):
+        return None
+    normals = pd.read_csv(path)
+    if 'Date' in normals.columns:
+        normals = normals.set_index(pd.to_datetime(normals['Date']))['Normal_Max']
+        return normals.reindex(daily_index)
+    lookup = normals.set_index(['Month', 'Day'])['Normal_Max']
+    keys = pd.MultiIndex.from_arrays([daily_index.month, daily_index.day])
+    return pd.Series(lookup.reindex(keys).to_numpy(), index=daily_index)
+
+
+def window_ids(index, logger_flags_df, loggers):
+    """
+    Label every (timestamp, logger) cell with its analysis window:
+    0 = pre-intervention (Baseline_Start to Intervention_Start),
+    1 = post-intervention (Intervention_Start to Post_Intervention_End, inclusive of the end day),
+    -1 = outside both windows.
+    """
+    flags = logger_flags_df.set_index('Loggers').reindex(loggers)
+    times = index.values[:, None]
+    baseline = pd.to_datetime(flags['Baseline_Start']).values[None, :]
+    start = pd.to_datetime(flags['Intervention_Start']).values[None, :]
+    end = (pd.to_datetime(flags['Post_Intervention_End']) + pd.Timedelta(days=1)).values[None, :]
+
+    ids = np.full((len(index), len(loggers)), -1, dtype=np.int8)
+    ids[(times >= baseline) & (times < start)] = 0
+    ids[(times >= start) & (times < end)] = 1
+    return ids
+
+
+@timed('heatwave.exposure_metrics')
+def exposure_metrics(temperature, logger_flags_df, humidity=None,
+                     degree_thresholds=(35, 40), exceedance_threshold=35,
+                     heat_index_bands=HEAT_INDEX_BANDS):
+    """
+    Per-logger heat exposure in the pre- and post-intervention windows, computed in one
+    pass over the minute grid.
+
+    Parameters:
+    -----------
+    temperature : DataFrame
+        Indoor temperature on a regular time grid (DatetimeIndex), one column per logger
+    logger_flags_df : DataFrame
+        Contents of logger_flags.csv
+    humidity : DataFrame, optional
+        Relative humidity on the same grid as `temperature`; heat-index hours are skipped without
+        it. Heat-index bands count only minutes with both temperature and humidity, and are NaN
+        for a logger and window with no humidity at all
+    degree_thresholds : tuple of float
+        Temperatures (°C) above which degree-hours are accumulated
+    exceedance_threshold : float
+        Temperature (°C) used for the longest continuous exceedance
+    heat_index_bands : dict
+        Heat-index band name -> (lower, upper) in °C
+
+    Returns:
+    --------
+    Tidy DataFrame with one row per (logger, window, metric)
+    """
+    loggers = [logger for logger in logger_flags_df['Loggers'] if logger in temperature.columns]
+    values = temperature[loggers].to_numpy(dtype=float)
+    step_hours = pd.Series(temperature.index).diff().median() / pd.Timedelta(hours=1)
+
+    windows = window_ids(temperature.index, logger_flags_df, loggers)
+    valid = ~np.isnan(values) & (windows >= 0)
+
+    # One group per (logger, window); every metric below reduces into these cells
+    n_loggers = len(loggers)
+    group = np.where(valid, np.arange(n_loggers)[None, :] * 2 + windows, -1)
+    in_group = group >= 0
+    keys = group[in_group]
+    n_groups = n_loggers * 2
+
+    def hours(mask):
+        return np.bincount(keys, weights=mask[in_group], minlength=n_groups) * step_hours
+
+    metrics = {('Hours_Observed', None): hours(np.ones_like(values, dtype=bool))}
+    # Days each metric's Per_Day is taken over; heat-index bands only cover minutes with humidity
+    observed_days = {}
+
+    filled = np.where(valid, values, -np.inf)
+    for threshold in degree_thresholds:
+        excess = np.clip(filled - threshold, 0, None)
+        metrics[('Degree_Hours_Above', threshold)] = np.bincount(keys, weights=excess[in_group], minlength=n_groups) * step_hours
+        metrics[('Hours_Above', threshold)] = hours(filled > threshold)
+
+    if humidity is not None:
+        heat_index = calculate_heat_index(values, humidity.reindex(index=temperature.index, columns=loggers).to_numpy(dtype=float))
+        has_heat_index = ~np.isnan(heat_index)
+        heat_index_hours = hours(has_heat_index)
+        metrics[('Hours_Heat_Index_Observed', None)] = heat_index_hours
+        no_humidity = heat_index_hours == 0
+        for band, (lower, upper) in heat_index_bands.items():
+            in_band = has_heat_index & (heat_index >= lower) & (heat_index < upper)
+            key = (f'Hours_Heat_Index_{band.replace(" ", "_")}', lower)
+            metrics[key] = np.where(no_humidity, np.nan, hours(in_band))
+            observed_days[key] = heat_index_hours / 24
+
+    column, start, length = run_lengths(filled > exceedance_threshold, breaks=windows)
+    run_group = column * 2 + windows[start, column]
+    longest = np.zeros(n_groups)
+    np.maximum.at(longest, run_group, length * step_hours)
+    metrics[('Longest_Exceedance_Hours', exceedance_threshold)] = longest
+
+    flags = logger_flags_df.set_index('Loggers').reindex(loggers)
+    all_days = metrics[('Hours_Observed', None)] / 24
+    rows = []
+    for (metric, threshold), result in metrics.items():
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Run lengths are not additive, so they have no per-day rate
+            if metric == 'Longest_Exceedance_Hours':
+                per_day = np.full(n_groups, np.nan)
+            else:
+                per_day = result / observed_days.get((metric, threshold), all_days)
+        rows.append(pd.DataFrame({
+            'Logger': np.repeat(loggers, 2),
+            'Settlement': np.repeat(flags['Settlement'].to_numpy(), 2),
+            'Intervention': np.repeat(flags['Intervention'].to_numpy(), 2),
+            'Shaded': np.repeat(flags['Shaded'].to_numpy(), 2),
+            'Window': np.tile(['Pre', 'Post'], n_loggers),
+            'Metric': metric,
+            'Threshold': threshold,
+            'Value': result,
+            'Per_Day': per_day,
+        }))
+    return pd.concat(rows, ignore_index=True)
+
+
+def load_logger_humidity(index, data_dir='Cleaned Data'):
+    """Read relative humidity from the cleaned logger files onto the master minute grid."""
+    humidity = pd.DataFrame(index=index)
+    for file in glob.glob(os.path.join(data_dir, '*.csv')):
+        logger_id = os.path.basename(file).split('_')[0]
+        with stage('ingest.humidity', path=file) as record:
+            df = pd.read_csv(file, encoding='utf-8-sig')
+            record.rows = len(df)
+        humidity_col = 'Relative_Humidity(%)' if 'Relative_Humidity(%)' in df.columns else 'Humidity(%RH)'
+        df['DateTime'] = pd.to_datetime(df['Date'] + ' ' + df['Time'])
+        series = df.drop_duplicates('DateTime').set_index('DateTime')[humidity_col]
+        humidity[logger_id] = series.reindex(index)
+    return humidity
+
+
+if __name__ == '__main__':
+    with stage('ingest.master', path='master_dataframe.csv') as record:
+        master_df = pd.read_csv('master_dataframe.csv', index_col='DateTime', parse_dates=True)
+        record.rows = len(master_df)
+    logger_flags_df = pd.read_csv('logger_flags.csv')
+
+    loggers = [logger for logger in logger_flags_df['Loggers'] if logger in master_df.columns]
+
+    # Heat-wave days for ambient and every logger at once; loggers are judged against the ambient maximum
+    daily_max = master_df[['Env_Temperature'] + loggers].resample('D').max()
+    ambient_normal = load_normal_max(daily_max.index)
+    if ambient_normal is None:
+        # Stand-in only: the study period's own mean maximum is hotter than the climatological
+        # normal, so departures above 4.5/6.4 °C are rarer and ambient heat-wave days are undercounted
+        print("Warning: normal_max_temperature.csv not found; using the study-period mean daily "
+              "maximum as the ambient normal. Ambient heat-wave counts are not IMD-comparable.")
+        ambient_normal = daily_max['Env_Temperature'].mean()
+    normal_max = pd.DataFrame({column: daily_max['Env_Temperature'] for column in loggers})
+    normal_max['Env_Temperature'] = ambient_normal
+    heat_wave_df = heat_wave_days(daily_max, normal_max)
+
+    humidity = load_logger_humidity(master_df.index) if os.path.isdir('Cleaned Data') else None
+    exposure_df = exposure_metrics(master_df[loggers], logger_flags_df, humidity=humidity)
+
+    print("Heat-wave days by series:")
+    print(heat_wave_df[heat_wave_df['Classification'] != 'Normal'].groupby(['Series', 'Classification']).size().unstack(fill_value=0))
+    print("\nExposure metrics:")
+    print(exposure_df.pivot_table(index=['Intervention', 'Window'], columns=['Metric', 'Threshold'], values='Per_Day', aggfunc='mean', dropna=True))
+    print(exposure_df[exposure_df['Metric'] == 'Longest_Exceedance_Hours'].groupby(['Intervention', 'Window'])['Value'].mean())
+
+    heat_wave_df.to_csv('heat_wave_days.csv', index=False)
+    exposure_df.to_csv('heat_exposure_metrics.csv', index=False)
@@ -2,7 +2,9 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.stats import gaussian_kde
+from profiling import timed
 
+@timed('plot.hexbin')
 def create_hexbin_plot(data, title):
     """Create a single hexbin plot with WBGT lines and dynamic scaling"""
     
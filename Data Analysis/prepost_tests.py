@@ -0,0 +1,272 @@
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import numpy as np
+from scipy import stats
+from profiling import stage, timed, propagate, is_profiled
+
+PERIODS = ['Full', 'Day', 'Night']
+
+
+class LoggerSlices:
+    """
+    Pre/post temperature differences of every logger, split into daytime (06:00-19:00)
+    and night-time slices. Each slice is sorted once and keeps its distinct values, moments
+    and hourly sums, so any subset of loggers can be tested without copying the minute data again.
+
+    Parameters:
+    -----------
+    temperature_differences_df : DataFrame
+        Contents of temperature_differences.csv
+    logger_flags_df : DataFrame
+        Contents of logger_flags.csv
+    """
+
+    def __init__(self, temperature_differences_df, logger_flags_df):
+        if 'DateTime' in temperature_differences_df.columns:
+            temperature_differences_df = temperature_differences_df.set_index('DateTime')
+        index = pd.DatetimeIndex(temperature_differences_df.index)
+        hours = index.hour.values
+        daytime = (hours >= 6) & (hours < 19)
+
+        self.flags = logger_flags_df.set_index('Loggers')
+        self.sorted = {}
+        self.distinct = {}
+        self.moments = {}
+        self.hourly = {}
+
+        with stage('prepost.slices', rows=len(index)):
+            self._build(temperature_differences_df, index, hours, daytime)
+
+    def _build(self, temperature_differences_df, index, hours, daytime):
+        for logger, row in self.flags.iterrows():
+            if logger not in temperature_differences_df.columns:
+                continue
+            values = temperature_differences_df[logger].to_numpy(dtype=float)
+            intervention_start = pd.to_datetime(row['Intervention_Start'])
+            intervention_end = pd.to_datetime(row['Post_Intervention_End']) + pd.Timedelta(days=1)
+            windows = {
+                'Pre': index < intervention_start,
+                'Post': (index >= intervention_start) & (index < intervention_end),
+            }
+            for window, in_window in windows.items():
+                for is_day in (True, False):
+                    mask = in_window & (daytime == is_day) & ~np.isnan(values)
+                    slice_values = values[mask]
+                    key = (logger, window, is_day)
+                    self.sorted[key] = np.sort(slice_values)
+                    self.distinct[key] = np.unique(self.sorted[key], return_counts=True)
+                    self.moments[key] = (slice_values.size, slice_values.sum(), np.square(slice_values).sum())
+                    self.hourly[key] = (
+                        np.bincount(hours[mask], weights=slice_values, minlength=24),
+                        np.bincount(hours[mask], minlength=24),
+                    )
+
+    def loggers(self, settlement, intervention, shaded):
+        flags = self.flags
+        selected = flags[
+            (flags['Settlement'] == settlement) &
+            (flags['Intervention'] == intervention) &
+            (flags['Shaded'] == shaded)
+        ].index
+        return [logger for logger in selected if (logger, 'Pre', True) in self.sorted]
+
+
+def _period_flags(period):
+    return {'Full': (True, False), 'Day': (True,), 'Night': (False,)}[period]
+
+
+def rank_sum_test(pre_sorted, post_sorted, distinct):
+    """
+    Mann-Whitney U test (normal approximation with tie and continuity correction) that
+    works directly on the per-slice sorted arrays, without merging or re-sorting them.
+
+    U is counted pairwise between slices with `searchsorted`: every post value scores the
+    pre values below it plus half of those equal to it. The tie correction comes from the
+    per-slice distinct values and counts, so only those (far fewer) values are combined.
+
+    Parameters:
+    -----------
+    pre_sorted, post_sorted : list of ndarray
+        Sorted pre- and post-intervention slices
+    distinct : list of (ndarray, ndarray)
+        (distinct values, counts) of every slice in the subset, pre and post
+
+    Returns:
+    --------
+    (U statistic of the post sample, two-sided p-value, Cliff's delta of post vs pre)
+    """
+    n_pre = sum(a.size for a in pre_sorted)
+    n_post = sum(b.size for b in post_sorted)
+    if n_pre == 0 or n_post == 0:
+        return np.nan, np.nan, np.nan
+
+    u_post = 0.0
+    for post in post_sorted:
+        for pre in pre_sorted:
+            below = np.searchsorted(pre, post, side='left').sum()
+            not_above = np.searchsorted(pre, post, side='right').sum()
+            u_post += (below + not_above) / 2
+
+    # Tie groups of the pooled sample: add up the counts of equal values across slices
+    values = np.concatenate([v for v, _ in distinct])
+    counts = np.concatenate([c for _, c in distinct]).astype(float)
+    _, group = np.unique(values, return_inverse=True)
+    ties = np.bincount(group, weights=counts)
+
+    n = n_pre + n_post
+    mean_u = n_pre * n_post / 2
+    tie_term = (ties ** 3 - ties).sum() / (n * (n - 1))
+    sd_u = np.sqrt(n_pre * n_post / 12 * ((n + 1) - tie_term))
+    z = (abs(u_post - mean_u) - 0.5) / sd_u if sd_u > 0 else np.nan
+    p_value = 2 * stats.norm.sf(z) if sd_u > 0 else np.nan
+
+    cliffs_delta = 2 * u_post / (n_pre * n_post) - 1
+    return u_post, min(p_value, 1.0), cliffs_delta
+
+
+def welch_test(pre_moments, post_moments):
+    """Welch t-test and Hedges' g (post - pre) from per-slice (count, sum, sum of squares)."""
+    def pooled(moments):
+        n = sum(m[0] for m in moments)
+        total = sum(m[1] for m in moments)
+        total_sq = sum(m[2] for m in moments)
+        if n < 2:
+            return n, np.nan, np.nan
+        mean = total / n
+        var = max(total_sq - n * mean ** 2, 0) / (n - 1)
+        return n, mean, var
+
+    n_pre, mean_pre, var_pre = pooled(pre_moments)
+    n_post, mean_post, var_post = pooled(post_moments)
+    if n_pre < 2 or n_post < 2:
+        return np.nan, np.nan, np.nan, np.nan
+
+    t_stat, p_value = stats.ttest_ind_from_stats(mean_post, np.sqrt(var_post), n_post,
+                                                 mean_pre, np.sqrt(var_pre), n_pre,
+                                                 equal_var=False)
+    pooled_sd = np.sqrt(((n_pre - 1) * var_pre + (n_post - 1) * var_post) / (n_pre + n_post - 2))
+    correction = 1 - 3 / (4 * (n_pre + n_post) - 9)
+    hedges_g = (mean_post - mean_pre) / pooled_sd * correction if pooled_sd > 0 else np.nan
+    return t_stat, p_value, hedges_g, mean_post - mean_pre
+
+
+def paired_hourly_test(pre_hourly, post_hourly):
+    """
+    Wilcoxon signed-rank test on logger x hour-of-day pairs: each pair is one logger's
+    mean for an hour of the day before and after the intervention, instead of
+    truncating the raw pre/post series to a common length.
+    """
+    differences = []
+    for (pre_sum, pre_count), (post_sum, post_count) in zip(pre_hourly, post_hourly):
+        paired = (pre_count > 0) & (post_count > 0)
+        differences.append(post_sum[paired] / post_count[paired] - pre_sum[paired] / pre_count[paired])
+    differences = np.concatenate(differences) if differences else np.array([])
+
+    if differences.size < 2 or np.all(differences == 0):
+        return np.nan, np.nan, differences.size, np.nan
+    w_statistic, p_value = stats.wilcoxon(differences)
+    return w_statistic, p_value, differences.size, np.median(differences)
+
+
+@timed('prepost.test_subset')
+def test_subset(slices, settlement, intervention, shaded, period):
+    """Run every test for one settlement x intervention x shading x period subset."""
+    loggers = slices.loggers(settlement, intervention, shaded)
+    keys = [(logger, is_day) for logger in loggers for is_day in _period_flags(period)]
+
+    pre_keys = [(logger, 'Pre', is_day) for logger, is_day in keys]
+    post_keys = [(logger, 'Post', is_day) for logger, is_day in keys]
+
+    u_stat, u_p, cliffs_delta = rank_sum_test([slices.sorted[k] for k in pre_keys],
+                                              [slices.sorted[k] for k in post_keys],
+                                              [slices.distinct[k] for k in pre_keys + post_keys])
+    t_stat, t_p, hedges_g, mean_diff = welch_test([slices.moments[k] for k in pre_keys],
+                                                  [slices.moments[k] for k in post_keys])
+
+    # Combine day and night hours of a logger into one 24-hour profile before pairing
+    pre_hourly, post_hourly = [], []
+    for logger in loggers:
+        for window, target in (('Pre', pre_hourly), ('Post', post_hourly)):
+            parts = [slices.hourly[(logger, window, is_day)] for is_day in _period_flags(period)]
+            target.append((sum(p[0] for p in parts), sum(p[1] for p in parts)))
+    w_stat, w_p, n_pairs, median_diff = paired_hourly_test(pre_hourly, post_hourly)
+
+    return {
+        'Settlement': settlement,
+        'Intervention': intervention,
+        'Shaded': shaded,
+        'Period': period,
+        'Loggers': len(loggers),
+        'N_Pre': sum(slices.moments[k][0] for k in pre_keys),
+        'N_Post': sum(slices.moments[k][0] for k in post_keys),
+        'Mean_Difference': mean_diff,
+        'Welch_t': t_stat,
+        'Welch_p': t_p,
+        'Hedges_g': hedges_g,
+        'Mann_Whitney_U': u_stat,
+        'Mann_Whitney_p': u_p,
+        'Cliffs_Delta': cliffs_delta,
+        'Wilcoxon_W': w_stat,
+        'Wilcoxon_p': w_p,
+        'Wilcoxon_Pairs': n_pairs,
+        'Median_Paired_Difference': median_diff,
+    }
+
+
+@timed('prepost.run_all_tests')
+def run_all_tests(temperature_differences_df, logger_flags_df, periods=PERIODS, n_jobs=4):
+    """
+    Pre/post tests for every settlement x intervention x shading x period subset.
+
+    Parameters:
+    -----------
+    temperature_differences_df : DataFrame
+        Contents of temperature_differences.csv
+    logger_flags_df : DataFrame
+        Contents of logger_flags.csv
+    periods : list of str
+        Any of 'Full', 'Day' and 'Night'
+    n_jobs : int
+        Number of worker threads; the searchsorted calls and reductions release the GIL,
+        so subsets share the sorted slices without being copied to processes. Subsets run
+        on the calling thread instead when this stage or prepost.test_subset is profiled,
+        since the profiler only samples the thread that started it
+
+    Returns:
+    --------
+    DataFrame with one row per subset
+    """
+    slices = LoggerSlices(temperature_differences_df, logger_flags_df)
+
+    subsets = [
+        subset for subset in itertools.product(
+            sorted(logger_flags_df['Settlement'].unique()),
+            sorted(logger_flags_df['Intervention'].unique()),
+            [True, False],
+            periods,
+        )
+        if slices.loggers(*subset[:3])
+    ]
+
+    if n_jobs == 1 or is_profiled('prepost.run_all_tests', 'prepost.test_subset'):
+        results = [test_subset(slices, *subset) for subset in subsets]
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(propagate(lambda subset: test_subset(slices, *subset)), subsets))
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+    with stage('ingest.temperature_differences', path='temperature_differences.csv') as record:
+        temperature_differences_df = pd.read_csv('temperature_differences.csv', parse_dates=['DateTime'])
+        record.rows = len(temperature_differences_df)
+    logger_flags_df = pd.read_csv('logger_flags.csv')
+
+    results_df = run_all_tests(temperature_differences_df, logger_flags_df)
+
+    print("Pre/post test results:")
+    print(results_df.to_string())
+
+    results_df.to_csv('prepost_test_results.csv', index=False)
@@ -0,0 +1,297 @@
+"""
+Stage timing and memory instrumentation for the ingestion, analysis and plotting code.
+
+Instrumentation is off unless enabled, either with `enable(...)` or by setting the
+STAGE_TRACE environment variable to a trace file path (.jsonl or .csv). When it is
+off, `stage` hands back a shared no-op context and `timed` calls the wrapped function
+directly, so instrumented code runs at its normal speed.
+
+Each finished stage appends one record to the trace: wall seconds, CPU seconds of the
+thread that ran the stage, process peak RSS and how much it grew during the stage, plus
+rows processed and bytes read when the caller reports them. Peak RSS is process-wide,
+so stages running concurrently in other threads share it. A stage's parent is the stage
+open on the same thread; wrap work handed to a thread pool with `propagate` so its
+stages report the submitting stage as their parent. Stages listed in STAGE_PROFILE (comma separated) or
+`profile_stages` are additionally run under pyinstrument's sampling profiler, or
+cProfile if pyinstrument is not installed, with one output file per run written to
+`profile_dir`. Both profilers only see the thread that started them, and only one
+profiled stage runs at a time: a profiled stage that starts while another is being
+profiled (nested, or on another thread) is timed as usual but not profiled, and the
+skip is logged. Profiling never raises into the instrumented code.
+
+Usage:
+    from profiling import stage, timed
+
+    with stage('load.master', path='master_dataframe.csv') as record:
+        master_df = pd.read_csv('master_dataframe.csv')
+        record.rows = len(master_df)
+"""
+import os
+import sys
+import csv
+import json
+import logging
+import time
+import threading
+import functools
+import itertools
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACE_FIELDS = ['stage', 'parent', 'started', 'wall_s', 'cpu_s', 'peak_rss_mb', 'rss_growth_mb', 'rows', 'bytes_read', 'error']
+
+_enabled = False
+_trace_path = None
+_profile_stages = set()
+_profile_dir = 'profiles'
+_lock = threading.Lock()
+_local = threading.local()
+_profile_runs = itertools.count(1)
+_profiling = None  # name of the stage currently being profiled
+
+logger = logging.getLogger(__name__)
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def enable(trace_path='stage_trace.jsonl', profile_stages=(), profile_dir='profiles'):
+    """
+    Turn instrumentation on.
+
+    Parameters:
+    -----------
+    trace_path : str
+        File that stage records are appended to; '.csv' writes CSV, anything else JSON lines
+    profile_stages : iterable of str
+        Stage names to run under the sampling profiler
+    profile_dir : str
+        Directory for profiler output
+    """
+    global _enabled, _trace_path, _profile_stages, _profile_dir
+    _trace_path = trace_path
+    _profile_stages = set(profile_stages)
+    _profile_dir = profile_dir
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def _write_record(record):
+    if _trace_path is None:
+        return
+    with _lock:
+        if _trace_path.endswith('.csv'):
+            file_exists = os.path.isfile(_trace_path)
+            with open(_trace_path, mode='a', newline='', encoding='utf-8') as file:
+                writer = csv.DictWriter(file, fieldnames=TRACE_FIELDS)
+                if not file_exists:
+                    writer.writeheader()
+                writer.writerow(record)
+        else:
+            with open(_trace_path, mode='a', encoding='utf-8') as file:
+                file.write(json.dumps(record) + '\n')
+
+
+def _start_profiler(name):
+    """Start a profiler for stage `name`, or return None if one is already running or it fails."""
+    global _profiling
+    with _lock:
+        if _profiling is not None:
+            logger.warning("Not profiling stage '%s': stage '%s' is already being profiled", name, _profiling)
+            return None
+        _profiling = name
+
+    try:
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = Profiler(interval=0.001)
+            profiler.start()
+        return profiler
+    except Exception as exc:
+        # e.g. cProfile on Python 3.12+ when another profiling tool holds the hook
+        logger.warning("Not profiling stage '%s': %s", name, exc)
+        with _lock:
+            _profiling = None
+        return None
+
+
+def _stop_profiler(profiler, name):
+    global _profiling
+    try:
+        if hasattr(profiler, 'output_html'):
+            profiler.stop()
+        else:
+            profiler.disable()
+
+        os.makedirs(_profile_dir, exist_ok=True)
+        # Repeated runs of a stage each get their own file
+        with _lock:
+            run = next(_profile_runs)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')[:-3]
+        base = os.path.join(_profile_dir, f'{name}-{stamp}-{threading.get_ident()}-{run:04d}')
+        if hasattr(profiler, 'output_html'):
+            with open(base + '.html', 'w', encoding='utf-8') as file:
+                file.write(profiler.output_html())
+        else:
+            profiler.dump_stats(base + '.prof')
+    except Exception as exc:
+        logger.warning("Could not write profile of stage '%s': %s", name, exc)
+    finally:
+        with _lock:
+            _profiling = None
+
+
+class _Stage:
+    """Context manager that measures one stage. Callers may set `rows` and `bytes_read` on it."""
+
+    def __init__(self, name, rows=None, path=None):
+        self.name = name
+        self.rows = rows
+        self.bytes_read = os.path.getsize(path) if path is not None and os.path.isfile(path) else None
+
+    def __enter__(self):
+        self.profiler = _start_profiler(self.name) if self.name in _profile_stages else None
+
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1] if stack else None
+        stack.append(self.name)
+
+        self.started = datetime.now().isoformat(timespec='milliseconds')
+        self.rss_before = _peak_rss_mb()
+        self.cpu_before = time.thread_time()
+        self.wall_before = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.wall_before
+        cpu = time.thread_time() - self.cpu_before
+        peak_rss = _peak_rss_mb()
+        if self.profiler is not None:
+            _stop_profiler(self.profiler, self.name)
+        _local.stack.pop()
+
+        _write_record({
+            'stage': self.name,
+            'parent': self.parent,
+            'started': self.started,
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu, 6),
+            'peak_rss_mb': None if peak_rss is None else round(peak_rss, 2),
+            'rss_growth_mb': None if peak_rss is None else round(peak_rss - self.rss_before, 2),
+            'rows': self.rows,
+            'bytes_read': self.bytes_read,
+            'error': None if exc_type is None else exc_type.__name__,
+        })
+        return False
+
+
+class _NullStage:
+    """Shared stand-in used while instrumentation is off; ignores everything set on it."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name, rows=None, path=None):
+    """
+    Measure the enclosed block as a named stage.
+
+    Parameters:
+    -----------
+    name : str
+        Stage name, e.g. 'ingest.master' or 'weather.parse'
+    rows : int, optional
+        Rows processed; can also be set on the returned record inside the block
+    path : str, optional
+        File read by the stage; its size is recorded as bytes_read
+    """
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name, rows, path)
+
+
+def is_profiled(*names):
+    """Whether any of the named stages will run under the sampling profiler."""
+    return _enabled and any(name in _profile_stages for name in names)
+
+
+def current_stage():
+    """Name of the innermost stage open on this thread, or None."""
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def propagate(func):
+    """
+    Wrap `func` for running on another thread, e.g. through a ThreadPoolExecutor, so the
+    stages it opens record the stage open here, at submission time, as their parent.
+    """
+    if not _enabled:
+        return func
+    parent = current_stage()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        saved = getattr(_local, 'stack', None)
+        _local.stack = [] if parent is None else [parent]
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.stack = saved
+    return wrapper
+
+
+def timed(name=None):
+    """Decorator that runs the function as a stage named `name` (default: module.function)."""
+    def decorator(func):
+        stage_name = name or f'{func.__module__}.{func.__name__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+if os.environ.get('STAGE_TRACE'):
+    enable(
+        os.environ['STAGE_TRACE'],
+        profile_stages=[s.strip() for s in os.environ.get('STAGE_PROFILE', '').split(',') if s.strip()],
+        profile_dir=os.environ.get('STAGE_PROFILE_DIR', 'profiles'),
+    )
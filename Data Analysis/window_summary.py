@@ -0,0 +1,174 @@
+import pandas as pd
+import numpy as np
+from profiling import stage, timed
+
+# Window name -> (start column, end column, whether the end timestamp is included)
+WINDOWS = {
+    'Baseline': ('Baseline_Start', 'Intervention_Start', False),
+    'Intervention': ('Intervention_Start', 'Post_Intervention_End', True),
+}
+
+# Statistic name -> function of the segment reductions (count, sum, sum_sq, max, min)
+STATISTICS = {
+    'Max': lambda r: r['max'],
+    'Min': lambda r: r['min'],
+    'Average': lambda r: r['sum'] / r['count'],
+}
+
+
+def window_bounds(index, logger_flags_df, windows=WINDOWS):
+    """
+    Convert every logger's window dates into integer row bounds on the minute grid.
+
+    Parameters:
+    -----------
+    index : DatetimeIndex
+        Sorted minute grid shared by the frames being summarised
+    logger_flags_df : DataFrame
+        Contents of logger_flags.csv (or any frame with one row per logger and the window columns)
+    windows : dict
+        Window name -> (start column, end column, include end)
+
+    Returns:
+    --------
+    int array of shape (loggers, windows, 2) holding [start, stop) row positions
+    """
+    grid = index.values
+    bounds = np.empty((len(logger_flags_df), len(windows), 2), dtype=np.int64)
+    for w, (start_col, end_col, include_end) in enumerate(windows.values()):
+        starts = pd.to_datetime(logger_flags_df[start_col]).values
+        ends = pd.to_datetime(logger_flags_df[end_col]).values
+        bounds[:, w, 0] = np.searchsorted(grid, starts, side='left')
+        bounds[:, w, 1] = np.searchsorted(grid, ends, side='right' if include_end else 'left')
+    return bounds
+
+
+@timed('window_summary.segment_reductions')
+def segment_reductions(values, bounds, exclude_zero=True):
+    """
+    Count, sum, sum of squares, max and min of every (logger, window) segment, using one
+    `reduceat` call per reduction across all loggers.
+
+    Parameters:
+    -----------
+    values : ndarray (time x loggers)
+        Minute values, one column per logger in the same order as `bounds`
+    bounds : ndarray (loggers x windows x 2)
+        Output of `window_bounds`
+    exclude_zero : bool
+        Treat exact zeros as missing, as the original summary cells did (default: True)
+    """
+    n_time, n_loggers = values.shape
+
+    # Lay loggers end to end with one padding row each, so every stop position is a valid index
+    padded = np.full((n_loggers, n_time + 1), np.nan)
+    padded[:, :n_time] = values.T
+    flat = padded.ravel()
+    valid = ~np.isnan(flat)
+    if exclude_zero:
+        valid &= flat != 0
+
+    offsets = (np.arange(n_loggers) * (n_time + 1))[:, None, None]
+    indices = (bounds + offsets).reshape(-1)
+    empty = (bounds[..., 1] <= bounds[..., 0])
+
+    def reduce(ufunc, data):
+        return ufunc.reduceat(data, indices)[::2].reshape(bounds.shape[:2])
+
+    reductions = {
+        'count': reduce(np.add, valid.astype(np.int64)),
+        'sum': reduce(np.add, np.where(valid, flat, 0)),
+        'sum_sq': reduce(np.add, np.where(valid, flat ** 2, 0)),
+        'max': reduce(np.maximum, np.where(valid, flat, -np.inf)),
+        'min': reduce(np.minimum, np.where(valid, flat, np.inf)),
+    }
+
+    # reduceat returns the start element for empty segments, so blank those out
+    missing = empty | (reductions['count'] == 0)
+    reductions['count'] = np.where(empty, 0, reductions['count'])
+    for name in ('sum', 'sum_sq', 'max', 'min'):
+        reductions[name] = np.where(missing, np.nan, reductions[name])
+    return reductions
+
+
+@timed('window_summary.summarize_windows')
+def summarize_windows(frames, logger_flags_df, windows=WINDOWS, statistics=STATISTICS, exclude_zero=True):
+    """
+    Window statistics for every logger and every frame without rescanning the minute tables.
+
+    Parameters:
+    -----------
+    frames : dict
+        Label -> minute DataFrame with a DatetimeIndex (or 'DateTime' column) and one column
+        per logger, e.g. {'Master': master_df, 'Temp Diff': temperature_differences_df}
+    logger_flags_df : DataFrame
+        Contents of logger_flags.csv
+    windows : dict
+        Window name -> (start column, end column, include end)
+    statistics : dict
+        Statistic name -> function of the segment reductions dict
+    exclude_zero : bool
+        Treat exact zeros as missing (default: True)
+
+    Returns:
+    --------
+    dict of window name -> DataFrame laid out like baseline_temperature_analysis_combined.csv
+    """
+    frames = {
+        label: df.set_index('DateTime') if 'DateTime' in df.columns else df
+        for label, df in frames.items()
+    }
+    index = next(iter(frames.values())).index
+    loggers = [logger for logger in logger_flags_df['Loggers'] if all(logger in df.columns for df in frames.values())]
+    flags = logger_flags_df.set_index('Loggers').loc[loggers]
+
+    bounds = window_bounds(index, flags, windows)
+
+    results = {
+        window: pd.DataFrame({
+            'Logger': loggers,
+            'Settlement': flags['Settlement'].values,
+            'Shaded': flags['Shaded'].values,
+            'Intervention Type': flags['Intervention'].values,
+        })
+        for window in windows
+    }
+
+    for label, df in frames.items():
+        if not df.index.equals(index):
+            df = df.reindex(index)
+        reductions = segment_reductions(df[loggers].to_numpy(dtype=float), bounds, exclude_zero)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            computed = {name: statistic(reductions) for name, statistic in statistics.items()}
+        for w, window in enumerate(windows):
+            for name, result in computed.items():
+                results[window][f'{label} {name} Temperature'] = result[:, w]
+
+    return results
+
+
+if __name__ == '__main__':
+    with stage('ingest.master', path='master_dataframe.csv') as record:
+        master_df = pd.read_csv('master_dataframe.csv', parse_dates=['DateTime'])
+        record.rows = len(master_df)
+    with stage('ingest.temperature_differences', path='temperature_differences.csv') as record:
+        temperature_differences_df = pd.read_csv('temperature_differences.csv', parse_dates=['DateTime'])
+        record.rows = len(temperature_differences_df)
+    logger_flags_df = pd.read_csv('logger_flags.csv')
+
+    summaries = summarize_windows(
+        {'Master': master_df, 'Temp Diff': temperature_differences_df},
+        logger_flags_df,
+    )
+
+    # The baseline table has only ever covered the U-series loggers
+    baseline_df = summaries['Baseline'][summaries['Baseline']['Logger'].str.startswith('U')]
+    intervention_df = summaries['Intervention']
+
+    print("\nBaseline Table of Results:")
+    print(baseline_df)
+    print("\nIntervention Table of Results:")
+    print(intervention_df)
+
+    baseline_df.to_csv('baseline_temperature_analysis_combined.csv', index=False)
+    intervention_df.to_csv('intervention_temperature_analysis_combined.csv', index=False)
@@ -7,6 +7,15 @@ from datetime import datetime
 import logging
 import sys
 import os
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+# Stage timing is optional here: add 'Data Analysis' to PYTHONPATH to trace the collector
+try:
+    from profiling import stage
+except ImportError:
+    def stage(name, rows=None, path=None):
+        return nullcontext(SimpleNamespace())
 
 # Set up logging with log rotation
 from logging.handlers import RotatingFileHandler
@@ -22,13 +31,19 @@ logging.basicConfig(handlers=[handler], level=logging.INFO,
 def fetch_weather_data():
     url = "https://weather.com/en-IN/weather/today/l/25.60,85.15"
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
+        with stage('weather.request') as record:
+            response = requests.get(url, timeout=10)
+            response.raise_for_status()
+            record.bytes_read = len(response.content)
     except requests.RequestException as e:
         logging.error(f"Failed to fetch data: {e}")
         return None
 
-    soup = BeautifulSoup(response.content, 'html.parser')
+    with stage('weather.parse', rows=1):
+        return parse_weather_data(response.content)
+
+def parse_weather_data(content):
+    soup = BeautifulSoup(content, 'html.parser')
 
     # Extracting data
     current_time = soup.select_one('span[class^="CurrentConditions--timestamp"]').get_text(strip=True).replace('As of ', '')
@@ -57,7 +72,7 @@ def fetch_weather_data():
 def write_to_csv(data, filename):
     try:
         file_exists = os.path.isfile(filename)
-        with open(filename, mode='a', newline='', encoding='utf-8') as file:
+        with stage('weather.write', rows=1), open(filename, mode='a', newline='', encoding='utf-8') as file:
             writer = csv.writer(file)
             if not file_exists:
                 writer.writerow(['Date', 'Current Time', 'Current Temperature', 'Day and Night Temperatures', 